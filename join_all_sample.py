@@ -1,12 +1,88 @@
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
-ndsbr_06 = pd.read_parquet("data/ndsbr.parquet")
-ndsbr_sample = pd.read_parquet("data/ndsbr_sample.parquet")
+FILES = ["data/ndsbr_sample.parquet", "data/ndsbr.parquet"]
+OUTPUT = "data/ndsbr_full.parquet"
+BATCH_SIZE = 500_000
+FLOAT32_COLS = ["long", "lat", "spd_kmh", "acel_ms2"]
+# Stored as text by older versions of main.py and as numbers by newer ones
+TEXT_TO_FLOAT_COLS = {"spd_limit": pa.float32(), "time_acum": pa.float64()}
 
-ndsbr = pd.concat([ndsbr_sample, ndsbr_06])
 
-ndsbr['trip'] = ndsbr['trip'].astype(str)
-ndsbr['valid_time'] = ndsbr['valid_time'].astype(str)
+def target_field(field: pa.Field) -> pa.Field:
+    # trip can be numeric in one file and text in the other, and categoricals
+    # are stored as dictionaries; the writer dictionary-encodes on its own
+    if field.name in ["trip", "valid_time"]:
+        return field.with_type(pa.string())
+    if field.name in TEXT_TO_FLOAT_COLS:
+        return field.with_type(TEXT_TO_FLOAT_COLS[field.name])
+    if pa.types.is_dictionary(field.type):
+        return field.with_type(field.type.value_type)
+    if field.name in FLOAT32_COLS:
+        return field.with_type(pa.float32())
+    return field
 
-ndsbr.to_parquet("data/ndsbr_full.parquet")
-ndsbr.to_csv("data/ndsbr_full.csv")
\ No newline at end of file
+
+def text_to_float(
+        column: pa.ChunkedArray, type_: pa.DataType
+    ) -> pa.ChunkedArray:
+    # Like pd.to_numeric(errors="coerce"): decimal commas are accepted and
+    # anything else that is not a plain number (e.g. a list of OSM speeds)
+    # becomes null, instead of making the cast fail
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if not (
+        pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+    ):
+        return column.cast(type_)
+    column = pc.replace_substring(pc.utf8_trim_whitespace(column), ",", ".")
+    is_number = pc.match_substring_regex(column, r"^[-+]?\d+(\.\d*)?$")
+    column = pc.if_else(is_number, column, pa.scalar(None, column.type))
+    return column.cast(type_)
+
+
+def file_schema(file: str) -> pa.Schema:
+    # The pandas metadata (and index columns) of the inputs is dropped, so the
+    # concatenated file reads back with a fresh RangeIndex
+    schema = pq.ParquetFile(file).schema_arrow
+    index_cols = (schema.pandas_metadata or {}).get("index_columns", [])
+    return pa.schema([
+        target_field(field) for field in schema.remove_metadata()
+        if field.name not in index_cols
+    ])
+
+
+# Like pd.concat, the output has the columns of both files. Types are
+# promoted where Arrow can do so safely; incompatible types raise here
+# instead of one file being cast to the other's type
+schema = pa.unify_schemas(
+    [file_schema(file) for file in FILES], promote_options="permissive"
+)
+
+# Casts (e.g. trip to string) run in Arrow's C++ kernels on each batch,
+# without going through pandas or creating Python str objects
+with pq.ParquetWriter(OUTPUT, schema, compression="zstd") as writer:
+    for file in FILES:
+        parquet_file = pq.ParquetFile(file)
+        columns = [
+            name for name in schema.names
+            if name in parquet_file.schema_arrow.names
+        ]
+        for batch in parquet_file.iter_batches(
+            batch_size=BATCH_SIZE, columns=columns
+        ):
+            table = pa.Table.from_batches([batch])
+            for name, type_ in TEXT_TO_FLOAT_COLS.items():
+                if name in table.column_names:
+                    table = table.set_column(
+                        table.column_names.index(name), name,
+                        text_to_float(table[name], type_)
+                    )
+            # Columns only present in the other file are filled with nulls
+            for field in schema:
+                if field.name not in table.column_names:
+                    table = table.append_column(
+                        field, pa.nulls(table.num_rows, field.type)
+                    )
+            writer.write_table(table.select(schema.names).cast(schema))
@@ -1,6 +1,26 @@
 from src import ndsbr
 from src import utils
-import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
+
+COLS = [
+    "DRIVER", "LONG", "LAT", "DAY", "TRIP", "ID", "PR", "TIME_ACUM",
+    "SPD_KMH", "VALID_TIME", 'TIMESTAMP', 'ACEL_MS2'
+]
+
+COL_TYPES = {
+    "DRIVER": pa.dictionary(pa.int32(), pa.string()),
+    "TRIP": pa.dictionary(pa.int32(), pa.string()),
+    "ID": pa.int64(),
+    "DAY": pa.string(),
+    "PR": pa.string(),
+    "VALID_TIME": pa.string(),
+    "TIMESTAMP": pa.string(),
+    "LONG": pa.float32(),
+    "LAT": pa.float32(),
+    "SPD_KMH": pa.float32(),
+    "ACEL_MS2": pa.float32()
+}
 
 def main() -> None:
     
@@ -14,7 +34,15 @@ def main() -> None:
     osm_vias = utils.import_osm("Curitiba, Brazil")
 
     print("Loading ndsbr data...")
-    nds_data = pd.read_csv(nds_path, sep=";", low_memory=False)
+    nds_table = pacsv.read_csv(
+        nds_path,
+        parse_options=pacsv.ParseOptions(delimiter=";"),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=COLS, column_types=COL_TYPES, decimal_point=",",
+            strings_can_be_null=True
+        )
+    )
+    nds_data = nds_table.to_pandas()
 
     print("Cleaning ndsbr data...")
     nds_data_cleaned = ndsbr.clean_cols(nds_data)
@@ -22,16 +50,41 @@ def main() -> None:
 
     print("Adding spatial data...")
     nds_spatial = ndsbr.create_spatial_data(nds_data_cleaned)
-    nds_sample = ndsbr.join_bairros_data(nds_spatial, bairros)
-    nds_sample = ndsbr.join_vias_data(nds_sample, vias)
-    nds_sample = ndsbr.join_vias_data(nds_sample, osm_vias)
+
+    # Build the spatial indexes once, in the CRS they are queried in, so
+    # every partition reuses them
+    bairros = bairros.to_crs(nds_spatial.crs)
+    vias = vias.to_crs(31982)
+    osm_vias = osm_vias.to_crs(31982)
+    for gdf in [bairros, vias, osm_vias]:
+        _ = gdf.sindex
+
+    nds_sample = ndsbr.join_by_partition(
+        nds_spatial, ndsbr.join_bairros_data, bairros
+    )
+    nds_utm = nds_sample.to_crs(31982)
+    nds_utm = ndsbr.join_by_partition(
+        nds_utm, ndsbr.join_vias_data_inner, vias
+    )
+    nds_utm = ndsbr.join_by_partition(
+        nds_utm, ndsbr.join_vias_data_inner, osm_vias
+    )
+    nds_sample = nds_utm.to_crs(4674)
     nds_sample = ndsbr.fill_missing_speed(nds_sample)
+    # Sorted rows keep the row groups' min/max statistics tight, so readers
+    # filtering on driver or date can skip row groups
+    nds_sample = nds_sample.sort_values(
+        ["driver", "datetime"], ignore_index=True
+    )
     nds_sample = ndsbr.fix_col_order(nds_sample)
 
     print("Saving ndsbr data...")
     nds_sample.info(show_counts=True, verbose=True)
-    nds_sample.to_csv("data/ndsbr.csv", index=False)
-    nds_sample.to_parquet("data/ndsbr.parquet")
+    nds_sample.to_parquet(
+        "data/ndsbr.parquet", engine="pyarrow", index=False,
+        compression="zstd", compression_level=5, row_group_size=512_000,
+        write_statistics=True
+    )
     #nds_sample.to_file("data/ndsbr.geojson", driver="GeoJSON")
 
 if __name__ == "__main__":
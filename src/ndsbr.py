@@ -1,14 +1,20 @@
+import os
+from typing import Callable
+
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import dask_geopandas as dgp
+import shapely
 
 def clean_cols(df: pd.DataFrame) -> pd.DataFrame:
     """
     Cleans and transforms the given DataFrame for NDSBR data processing.
 
-    This function selects specific columns from the DataFrame, renames them
-    to lowercase, and converts certain columns to appropriate data types.
-    Additionally, it combines the 'date' and 'time' columns to create a
-    'datetime' column.
+    This function renames the columns to lowercase and converts certain
+    columns to appropriate data types. Column selection is expected to be
+    done when reading the raw file (see `COLS` in main.py); numeric
+    columns that were already parsed as floats are left untouched.
 
     Args:
         df (pd.DataFrame): The input DataFrame containing raw NDSBR data.
@@ -16,12 +22,6 @@ def clean_cols(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: A DataFrame with cleaned and transformed NDSBR data.
     """
-    COLS = [
-        "DRIVER", "LONG", "LAT", "DAY", "TRIP", "ID", "PR", "TIME_ACUM",
-        "SPD_KMH", "VALID_TIME", 'TIMESTAMP', 'ACEL_MS2'
-    ]
-
-    df = df[COLS]
     df = df.rename(
         columns={
             "DRIVER": "driver",
@@ -39,7 +39,11 @@ def clean_cols(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     def to_float(df: pd.DataFrame, col: str) -> pd.Series:
-        return df[col].str.replace(",", ".").astype(float)
+        if pd.api.types.is_numeric_dtype(df[col]):
+            return pd.to_numeric(df[col], downcast="float")
+        return pd.to_numeric(
+            df[col].str.replace(",", ".", regex=False), downcast="float"
+        )
     
     for col in ["long", "lat", "spd_kmh", 'acel_ms2']:
         df[col] = to_float(df, col)
@@ -54,9 +58,10 @@ def create_datetime(
     Combines date and time columns into a single datetime column in the DataFrame.
 
     This function takes two column names representing date and time in the 
-    DataFrame, combines them into a single datetime string, and converts it 
-    into a pandas datetime object. The resulting datetime column is added 
-    to the DataFrame.
+    DataFrame, parses the dates and the times separately and adds them up 
+    into a pandas datetime column, so no intermediate datetime string is 
+    built. Each distinct date and time value is parsed only once. The 
+    resulting datetime column is added to the DataFrame.
 
     Args:
         date_col (str): The name of the column containing date values.
@@ -66,9 +71,25 @@ def create_datetime(
     Returns:
         pd.DataFrame: A DataFrame with an added 'datetime' column.
     """
-    df["datetime"] = df[date_col] + " " + df[time_col]
-    df["datetime"] = pd.to_datetime(df["datetime"], format='%d/%m/%Y %H:%M:%S')
-    df[date_col] = pd.to_datetime(df[date_col], format='%d/%m/%Y')
+    def parse_unique(col: str, parser) -> pd.Index:
+        # Traces repeat the same day/second over many rows: parse each
+        # distinct value once and broadcast it back with the codes
+        codes, uniques = pd.factorize(df[col], sort=False)
+        parsed = pd.Index(parser(uniques))
+        return parsed.take(codes, allow_fill=True, fill_value=pd.NaT)
+
+    dates = parse_unique(
+        date_col, lambda x: pd.to_datetime(x, format='%d/%m/%Y')
+    )
+    # Parsed as clock times (not pd.to_timedelta) so that malformed values
+    # such as "24:00:00" raise instead of rolling over to the next day
+    times = parse_unique(
+        time_col,
+        lambda x: pd.to_datetime(x, format='%H:%M:%S')
+        - pd.Timestamp('1900-01-01')
+    )
+    df["datetime"] = dates + times
+    df[date_col] = dates
 
     return df
 
@@ -87,8 +108,10 @@ def create_spatial_data(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: A GeoDataFrame with a 'geometry' column of Point objects.
     """
-    nds_geom = gpd.points_from_xy(df["long"], df["lat"])
-    nds_spatial = gpd.GeoDataFrame(df, geometry=nds_geom, crs=4674)
+    nds_geom = shapely.points(df["long"].to_numpy(), df["lat"].to_numpy())
+    nds_spatial = gpd.GeoDataFrame(
+        df, geometry=gpd.GeoSeries(nds_geom, index=df.index, crs=4674)
+    )
     return nds_spatial
 
 def join_bairros_data(
@@ -102,6 +125,13 @@ def join_bairros_data(
     of the two datasets. The resulting GeoDataFrame contains a column
     indicating which neighborhood each point belongs to.
 
+    The join is a single bulk query of the points against the neighborhoods'
+    spatial index, and the neighborhood column is stored as a categorical.
+    Points outside every neighborhood, including points lying exactly on a
+    border, get a missing value. Where neighborhoods overlap, a point is
+    assigned to the first of them in `bairros_data` instead of being
+    duplicated.
+
     If the two input GeoDataFrames do not have the same coordinate reference
     system (CRS), the function will convert the neighborhoods data to the CRS
     of the NDSBR data.
@@ -118,9 +148,20 @@ def join_bairros_data(
     if ndsbr_data.crs != bairros_data.crs:
         print("Fixing CRS...")
         bairros_data = bairros_data.to_crs(ndsbr_data.crs)
-    gdf = gpd.sjoin(bairros_data, ndsbr_data, how="right", predicate="contains")
-    # Remove index_left
-    gdf = gdf.drop(columns=["index_left"], axis=1)
+    pt_idx, poly_idx = bairros_data.sindex.query(
+        ndsbr_data.geometry.values, predicate="within"
+    )
+    # Overlapping polygons can match a point more than once: keep the
+    # match with the lowest polygon position, so the result is deterministic
+    order = np.lexsort((poly_idx, pt_idx))
+    pt_idx, first = np.unique(pt_idx[order], return_index=True)
+    poly_idx = poly_idx[order][first]
+    bairro_codes, bairro_names = pd.factorize(bairros_data["bairro"])
+    codes = np.full(len(ndsbr_data), -1, dtype=bairro_codes.dtype)
+    codes[pt_idx] = bairro_codes[poly_idx]
+    gdf = ndsbr_data.assign(
+        bairro=pd.Categorical.from_codes(codes, categories=bairro_names)
+    )
     return gdf
 
 def join_vias_data(
@@ -151,10 +192,85 @@ def join_vias_data(
     if vias_data.crs != 31982:
         print("Fixing CRS (vias)...")
         vias_data = vias_data.to_crs(31982)
-    gdf = gpd.sjoin_nearest(ndsbr_data, vias_data, how="left", max_distance=20)
-    gdf = gdf.to_crs(4674).drop(columns=["index_right"], axis=1)
+    gdf = join_vias_data_inner(ndsbr_data, vias_data)
+    gdf = gdf.to_crs(4674)
+    return gdf
+
+def join_vias_data_inner(
+        ndsbr_utm: gpd.GeoDataFrame, vias_utm: gpd.GeoDataFrame
+    ) -> gpd.GeoDataFrame:
+    """
+    Spatially joins NDSBR data with a streets dataset, without any CRS
+    handling.
+
+    Both input GeoDataFrames must already be in Sirgas 2000 UTM 22S
+    (EPSG:31982), so that the 20 m search distance is in meters. The result
+    is returned in that same CRS, which allows several street datasets to
+    be joined in a row with a single reprojection of the NDSBR points.
+
+    The nearest street of every point is found with one bulk query of the
+    streets' spatial index, so an index already built on `vias_utm` is
+    reused. When several streets are equally near, only one is kept.
+
+    Args:
+        ndsbr_utm (gpd.GeoDataFrame): A GeoDataFrame containing NDSBR data,
+            in EPSG:31982.
+        vias_utm (gpd.GeoDataFrame): A GeoDataFrame containing streets data,
+            in EPSG:31982.
+
+    Returns:
+        gpd.GeoDataFrame: A GeoDataFrame resulting from the spatial join of the
+            two input datasets, in EPSG:31982.
+    """
+    pt_idx, via_idx = vias_utm.sindex.nearest(
+        ndsbr_utm.geometry.values, return_all=False, max_distance=20
+    )
+    cols = vias_utm.columns.drop(vias_utm.geometry.name)
+    matched = vias_utm[cols].iloc[via_idx].set_axis(ndsbr_utm.index[pt_idx])
+    gdf = ndsbr_utm.join(matched)
     return gdf
 
+def join_by_partition(
+        ndsbr_data: gpd.GeoDataFrame,
+        join_func: Callable[
+            [gpd.GeoDataFrame, gpd.GeoDataFrame], gpd.GeoDataFrame
+        ],
+        other_data: gpd.GeoDataFrame,
+        npartitions: int | None = None
+    ) -> gpd.GeoDataFrame:
+    """
+    Applies a spatial join function to the NDSBR data in parallel.
+
+    The NDSBR points are split into row partitions with dask-geopandas and
+    `join_func(partition, other_data)` is run on each of them, so joins such
+    as `join_bairros_data` and `join_vias_data_inner` use all cores. The
+    other dataset is shared by every partition, so any spatial index already
+    built on it is reused. Both datasets must already be in the CRS expected
+    by `join_func`.
+
+    Args:
+        ndsbr_data (gpd.GeoDataFrame): A GeoDataFrame containing NDSBR data.
+        join_func (Callable): The join function, taking the NDSBR data and
+            the other dataset, in this order.
+        other_data (gpd.GeoDataFrame): The dataset joined to the NDSBR data.
+        npartitions (int | None): The number of partitions. Defaults to the
+            number of CPUs.
+
+    Returns:
+        gpd.GeoDataFrame: The concatenated result of the join, in the same
+            row order as the input.
+    """
+    if npartitions is None:
+        npartitions = os.cpu_count()
+    # Bind other_data instead of passing it through map_partitions, which
+    # would turn it into a single-partition dask frame
+    def func(partition: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        return join_func(partition, other_data)
+
+    nds_dask = dgp.from_geopandas(ndsbr_data, npartitions=npartitions)
+    gdf = nds_dask.map_partitions(func, meta=func(ndsbr_data.iloc[:0]))
+    return gdf.compute()
+
 def fill_missing_speed(ndsbr_data: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
     Fills missing speed limit values in the GeoDataFrame based on the type of
@@ -166,6 +282,9 @@ def fill_missing_speed(ndsbr_data: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     - 3: 40 km/h
     - 4: 30 km/h
 
+    The speed limit column is converted to numeric; values that cannot be
+    parsed as a number are treated as missing.
+
     Args:
         ndsbr_data (gpd.GeoDataFrame): The input GeoDataFrame containing the
             speed limit column.
@@ -174,14 +293,15 @@ def fill_missing_speed(ndsbr_data: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         gpd.GeoDataFrame: The input GeoDataFrame with the missing speed limit
             values filled.
     """
-    ndsbr_data["spd_limit"] = ndsbr_data["spd_limit"].fillna(
-        ndsbr_data["tipo_via_ctb"].replace({
-            "1": '70',
-            "2": '60',
-            "3": '40',
-            "4": '30'
-        })
-    )
+    spd_limit_from_type = ndsbr_data["tipo_via_ctb"].map({
+        "1": 70,
+        "2": 60,
+        "3": 40,
+        "4": 30
+    }).astype("float32")
+    ndsbr_data["spd_limit"] = pd.to_numeric(
+        ndsbr_data["spd_limit"], errors="coerce", downcast="float"
+    ).fillna(spd_limit_from_type)
     return ndsbr_data
         
 
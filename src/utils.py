@@ -1,15 +1,45 @@
 import geopandas as gpd
 import osmnx as ox
+import hashlib
 import os
 
-def load_bairros(url: str) -> gpd.GeoDataFrame:
+def url_cache_path(url: str) -> str:
     """
-    Loads bairros data from a given url and renames the columns.
+    Builds the GeoParquet cache file name for data loaded from a given url.
+    
+    The name combines the url's file name with a short hash of the whole 
+    url, so different sources never share a cache file.
+    
+    Parameters
+    ----------
+    url : str
+        The url the data is loaded from.
+    
+    Returns
+    -------
+    str
+        The path of the cache file, inside "data/cache".
+    """
+    stem = os.path.splitext(os.path.basename(url.rstrip("/")))[0]
+    digest = hashlib.sha1(url.encode()).hexdigest()[:8]
+    return os.path.join("data", "cache", f"{stem}_{digest}.parquet")
+
+def load_bairros(
+        url: str, cache: str | None = None
+    ) -> gpd.GeoDataFrame:
+    """
+    Loads bairros data from a given url and renames the columns. The result
+    is cached as GeoParquet, and the cached file is read instead of the url
+    if it already exists.
     
     Parameters
     ----------
     url : str
         The url to load the data from.
+    cache : str | None
+        The GeoParquet file used to cache the data. Defaults to a file named 
+        after the url (see `url_cache_path`), so changing the url does not 
+        return a layer cached from another source.
     
     Returns
     -------
@@ -17,19 +47,34 @@ def load_bairros(url: str) -> gpd.GeoDataFrame:
         A GeoDataFrame with the bairros data, with the columns "nome_bairro" 
         and "geometry".
     """
+    if cache is None:
+        cache = url_cache_path(url)
+    if os.path.exists(cache):
+        print("bairros already cached. Loading now...")
+        return gpd.read_parquet(cache)
     cols = ["NOME", "geometry"]
-    bairros = gpd.read_file(url)
+    bairros = gpd.read_file(url, engine="pyogrio", columns=["NOME"])
     bairros = bairros[cols].rename(columns={"NOME": "bairro"})
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    bairros.to_parquet(cache)
     return bairros
 
-def load_vias_cwb(url: str) -> gpd.GeoDataFrame:
+def load_vias_cwb(
+        url: str, cache: str | None = None
+    ) -> gpd.GeoDataFrame:
     """
-    Loads vias data from a given url and renames the columns.
+    Loads vias data from a given url and renames the columns. The result
+    is cached as GeoParquet, and the cached file is read instead of the url
+    if it already exists.
     
     Parameters
     ----------
     url : str
         The url to load the data from.
+    cache : str | None
+        The GeoParquet file used to cache the data. Defaults to a file named 
+        after the url (see `url_cache_path`), so changing the url does not 
+        return a layer cached from another source.
     
     Returns
     -------
@@ -37,8 +82,16 @@ def load_vias_cwb(url: str) -> gpd.GeoDataFrame:
         A GeoDataFrame with the vias data, with the columns "nome_via", 
         "tipo_via_cwb", "tipo_via_ctb", and "geometry".
     """
+    if cache is None:
+        cache = url_cache_path(url)
+    if os.path.exists(cache):
+        print("vias already cached. Loading now...")
+        return gpd.read_parquet(cache)
     cols = ["NMVIA", "SVIARIO", "HIERARQUIA", "geometry"]
-    vias = gpd.read_file(url, encoding="latin1")
+    vias = gpd.read_file(
+        url, engine="pyogrio", encoding="latin1",
+        columns=["NMVIA", "SVIARIO", "HIERARQUIA"]
+    )
     vias = vias[cols].rename(
         columns={
             "NMVIA": "nome_via",
@@ -46,12 +99,16 @@ def load_vias_cwb(url: str) -> gpd.GeoDataFrame:
             "HIERARQUIA": "tipo_via_ctb"
         }
     )
+    vias["tipo_via_ctb"] = vias["tipo_via_ctb"].astype("category")
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    vias.to_parquet(cache)
     return vias
 
 def import_osm(place: str) -> gpd.GeoDataFrame:
     """
-    Downloads the OSM road network for a given place and saves it to a file, 
-    if the file does not already exist. Then, reads the file into a GeoDataFrame.
+    Downloads the OSM road network for a given place and saves its edges to a 
+    GeoParquet file, if the file does not already exist. Then, reads the file 
+    into a GeoDataFrame.
     
     Parameters
     ----------
@@ -63,16 +120,22 @@ def import_osm(place: str) -> gpd.GeoDataFrame:
     gpd.GeoDataFrame
         The GeoDataFrame with the OSM road network data.
     """
-    file = "data/osmaxis/edges.shp"
+    file = "data/osmaxis/edges.parquet"
     if os.path.exists(file):
         print("osmdata already downloaded. Loading now...")
-    else:
-        LOCATION = place
-        NETWORK = "drive"
-        osmaxis = ox.graph_from_place(LOCATION, network_type=NETWORK)
-        ox.save_graph_shapefile(osmaxis, "data/osmaxis")
+        return gpd.read_parquet(file)
+    LOCATION = place
+    NETWORK = "drive"
+    osmaxis = ox.graph_from_place(LOCATION, network_type=NETWORK)
     cols = ["maxspeed", "geometry"]
-    axis = gpd.read_file(file)
-    axis = axis[cols].rename(columns={"maxspeed": "spd_limit"})
+    axis = ox.graph_to_gdfs(osmaxis, nodes=False, edges=True)[cols]
+    axis = axis.rename(columns={"maxspeed": "spd_limit"}).reset_index(drop=True)
+    # Merged edges can hold a list of speeds; store them as text, as the
+    # shapefile export did, so the column has a single type
+    axis["spd_limit"] = axis["spd_limit"].map(
+        lambda x: str(x) if isinstance(x, list) else x
+    )
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    axis.to_parquet(file)
 
     return axis